@@ -4,16 +4,19 @@ import click
 import os
 import subprocess
 import json
+import hashlib
 import csv
+import tempfile
 from datetime import datetime
 import pandas as pd
-import docker
-from gpustat.core import GPUStatCollection
-import time
+import pynvml
+import select
+import sys
+import signal
+import re
+import functools
 from itertools import product
-from mergedeep import merge
-import copy
-import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 import wandb
 
 import sqlite3
@@ -44,32 +47,77 @@ def create_table(conn, create_table_sql):
         print(e)
 
 
-def update_task_status(conn, benchmark_name, status):
+def update_tasks_status(conn, benchmark_names, status):
     try:
         c = conn.cursor()
-        c.execute("""UPDATE tasks SET status = ? WHERE benchmark_name = ?""", (status, benchmark_name))
+        c.executemany("""UPDATE tasks SET status = ? WHERE benchmark_name = ?""", [(status, benchmark_name) for benchmark_name in benchmark_names])
         conn.commit()
+        return True
     except Error as e:
         print(e)
+        conn.rollback()
+        return False
+
+@functools.lru_cache(maxsize=1)
+def get_wandb_api():
+    # created lazily so WANDB_API_KEY is set first, then shared by every clean_wandb_id call
+    return wandb.Api()
 
 def clean_wandb_id(run_id, config):
     try:
-        wandb.Api().run(f"{config['wandb']['user']}/{config['wandb']['project']}/{run_id}").delete()
+        get_wandb_api().run(f"{config['wandb']['user']}/{config['wandb']['project']}/{run_id}").delete()
         return True
     except Exception as e: 
         print(e)
         return False
 
 def get_config(benchmark_config_file):
+    # parsed config is cached as json next to the yaml, delete the sidecar to invalidate
+    cache_file = f"{benchmark_config_file}.json.cache"
+    if os.path.isfile(cache_file) and os.stat(cache_file).st_mtime >= os.stat(benchmark_config_file).st_mtime:
+        with open(cache_file, "r") as stream:
+            return json.load(stream)
+
+    config = None
     with open(benchmark_config_file, "r") as stream:
         try:
-            config=yaml.safe_load(stream)
+            config=yaml.load(stream, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
         except yaml.YAMLError as exc:
             print(exc)
+            return config
+
+    # only cache configs that survive the json round trip, e.g. int or bool mapping keys come back as strings
+    try:
+        config_json = json.dumps(config)
+    except (TypeError, ValueError):
+        return config
+    if json.loads(config_json) != config:
+        return config
+
+    tmp_file = None
+    try:
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_file)))
+        with os.fdopen(fd, "w") as stream:
+            stream.write(config_json)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(e)
+        if tmp_file and os.path.isfile(tmp_file):
+            os.remove(tmp_file)
     return config
 
+def deep_merge(base, override):
+    # recursive merge returning a new dict, nested dicts are merged and other values from override win
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
 def product_dict(**kwargs):
-    keys = kwargs.keys()
+    keys = tuple(kwargs)
     vals = kwargs.values()
     
     for instance in product(*vals):
@@ -77,24 +125,23 @@ def product_dict(**kwargs):
 
 
 
-def generate_all_benchmarks(config, interactive_mode, tracking_db):
+def generate_all_benchmarks(config, interactive_mode, tracking_conn, tags_memory):
     templates_ref = config['benchmarks-template']
+    # the merged config only depends on the benchmark, merge once instead of once per system
+    merged_benchmarks = {benchmark_name: deep_merge(templates_ref[benchmark_config['benchmark-template']], benchmark_config)
+                         for benchmark_name, benchmark_config in config["benchmarks"].items()}
     for system_name, system_config in config["systems"].items():
         
         if not system_config["active"]:
             print(f"Skipping Benchmarks for {system_name}")
         else:
             print(config["benchmarks"].items())
-            for benchmark_name, benchmark_config in config["benchmarks"].items():
+            for benchmark_name, this_benchmark_config in merged_benchmarks.items():
                 print("")
                 print("")
                 print(benchmark_name)
                 print("")
                 print("")
-                benchmark_template = templates_ref[benchmark_config['benchmark-template']]
-                
-                merge(benchmark_template, benchmark_config)
-                this_benchmark_config = benchmark_template
                 
                 if this_benchmark_config['active']:
                     print(f"Running {benchmark_name} for {system_name}")
@@ -102,23 +149,169 @@ def generate_all_benchmarks(config, interactive_mode, tracking_db):
                     build_docker(this_benchmark_config['docker'], benchmark_name)
                     
                     # if params item is a list => do the cardinality
-                    benchmarks_params = list(product_dict(**this_benchmark_config['params']))
-                    
-                    for benchmark_params in benchmarks_params:
-                        current_benchmark_config = copy.copy(this_benchmark_config)
-                        
-                        current_benchmark_config['params'] = benchmark_params
-                        print(f"Generating benchmark for {current_benchmark_config['params']}")
-                        generate_docker(system_name, system_config, benchmark_name, current_benchmark_config, config["data"], config["wandb"], interactive_mode, tracking_db)
+                    for benchmark_params in product_dict(**this_benchmark_config['params']):
+                        print(f"Generating benchmark for {benchmark_params}")
+                        experiments = generate_docker(system_name, system_config, benchmark_name, this_benchmark_config, benchmark_params, config["data"], config["wandb"], interactive_mode, tags_memory)
+                        write_experiments(tracking_conn, experiments)
                 else:
                     print(f"Skipping {benchmark_name} for {system_name}")
 
+def write_experiments(tracking_conn, experiments):
+    # committed per batch so the write lock is not held across docker builds
+    df = pd.DataFrame(experiments, columns=headers)
+    with tracking_conn.begin():
+        df.to_sql('tasks', con=tracking_conn, if_exists='append')
+
+def dockerignore_regex(pattern):
+    # translates the .dockerignore glob syntax, raises ValueError on patterns it can not translate
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                raise ValueError(f"unterminated character class in {pattern}")
+            body = pattern[i + 1:end]
+            negate = body.startswith("^")
+            if negate:
+                body = body[1:]
+            if not body:
+                raise ValueError(f"empty character class in {pattern}")
+            char_class = ""
+            j = 0
+            while j < len(body):
+                if body[j] == "\\" and j + 1 < len(body):
+                    char_class += re.escape(body[j + 1])
+                    j += 2
+                else:
+                    char_class += "-" if body[j] == "-" else re.escape(body[j])
+                    j += 1
+            # like *, a character class never matches the path separator
+            regex += "(?!/)[" + ("^" if negate else "") + char_class + "]"
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex)
+
+def get_dockerignore_patterns(path):
+    # (regex, exclude) pairs following .dockerignore syntax, later patterns win and ! re-includes
+    patterns = list()
+    dockerignore = os.path.join(path, ".dockerignore")
+    if os.path.isfile(dockerignore):
+        with open(dockerignore, "r") as stream:
+            for line in stream:
+                pattern = line.strip()
+                if not pattern or pattern.startswith("#"):
+                    continue
+                exclude = not pattern.startswith("!")
+                pattern = os.path.normpath(pattern.lstrip("!").strip()).lstrip("/")
+                try:
+                    patterns.append((dockerignore_regex(pattern), exclude))
+                except (ValueError, re.error) as e:
+                    # without every pattern the excluded files are unknown, hash the whole context instead
+                    print(f"Ignoring {dockerignore} for the context hash: {e}")
+                    return list()
+    return patterns
+
+def is_dockerignored(rel_path, patterns):
+    # a path is also ignored when one of its parent directories matches
+    parts = rel_path.split("/")
+    candidates = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    ignored = False
+    for regex, exclude in patterns:
+        if any(regex.fullmatch(candidate) for candidate in candidates):
+            ignored = exclude
+    return ignored
+
+def get_context_hash(path):
+    patterns = get_dockerignore_patterns(path)
+    context_hash = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            rel_path = os.path.relpath(file_path, path).replace(os.sep, "/")
+            # broken symlinks and files excluded from the docker context do not affect the image
+            if is_dockerignored(rel_path, patterns) or not os.path.isfile(file_path):
+                continue
+            context_hash.update(rel_path.encode())
+            with open(file_path, "rb") as stream:
+                for chunk in iter(lambda: stream.read(1 << 20), b""):
+                    context_hash.update(chunk)
+    return context_hash.hexdigest()
+
 def build_docker(docker_config, tag):
-    cmd = f"cd {docker_config['path']} && docker build -t {tag} -f {docker_config['dockerfile']} ."
+    # the image is labelled with the hash of its build context, an unchanged context skips the build
+    try:
+        context_hash = get_context_hash(docker_config['path'])
+    except OSError as e:
+        print(e)
+        context_hash = None
+
+    if context_hash is not None:
+        try:
+            image_hash = subprocess.run(["docker", "image", "inspect", "--format", '{{ index .Config.Labels "benchmarks.context-hash" }}', tag],
+                                        capture_output=True, text=True).stdout.strip()
+        except OSError as e:
+            print(e)
+            image_hash = ""
+        if image_hash == context_hash:
+            print(f"Docker for {docker_config['path']} - {tag} is up to date")
+            return
+
     print(f"Building docker for {docker_config['path']} - {tag}")
-    os.system(cmd)
+    label = ["--label", f"benchmarks.context-hash={context_hash}"] if context_hash is not None else []
+    try:
+        build = subprocess.run(["docker", "build", *label, "-t", tag,
+                                "-f", os.path.join(docker_config['path'], docker_config['dockerfile']), docker_config['path']],
+                               env={**os.environ, "DOCKER_BUILDKIT": "1"})
+    except OSError as e:
+        print(e)
+        print(f"Building docker for {docker_config['path']} - {tag} failed")
+        return
+    if build.returncode != 0:
+        print(f"Building docker for {docker_config['path']} - {tag} failed")
+
+@functools.lru_cache(maxsize=1)
+def get_memory_info():
+    # single dmidecode call, read once per process since the memory layout does not change while generating
+    try:
+        dmidecode = subprocess.run(["dmidecode", "--type", "17"], capture_output=True, text=True).stdout
+    except OSError as e:
+        print(e)
+        dmidecode = ""
+
+    memory_info = list()
+    for item in ['Size', 'Speed', 'Manufacturer', 'Type', 'Configured Memory Speed', 'Form Factor']:
+        match = re.search(rf"^\s*{re.escape(item)}: (.*)$", dmidecode, re.MULTILINE)
+        value = match.group(1).strip() if match else ""
+        key = f"mem_info_{item.lower().replace(' ','_')}"
+
+        for unit in ["MB", "MT/s"]:
+            if unit in value:
+                value = value.replace(unit, '').strip()
+                key += f"_{unit.replace('/','_per_')}"
 
-def generate_docker(system_name, system_config, benchmark_name, benchmark_config, data_config, wandb_config, interactive_mode, tracking_db):
+        memory_info.append(f"{key}={value}")
+    return tuple(memory_info)
+
+def generate_docker(system_name, system_config, benchmark_name, benchmark_config, params, data_config, wandb_config, interactive_mode, tags_memory):
     NB_CUDA_DEVICES = len(system_config['devices-ids'])
     devices_ids = [str(id) for id in system_config['devices-ids']]
     NVIDIA_VISIBLE_DEVICES=",".join(devices_ids)
@@ -128,63 +321,54 @@ def generate_docker(system_name, system_config, benchmark_name, benchmark_config
     mounts = ""
     for data_source, mount_point in benchmark_config['docker']['mounts'].items():
         mounts += f"-v {data_config[data_source]}:{mount_point} "
-    
-    for capability, is_active in system_config['compute-capabilities'].items():
-        if is_active:
 
-            print(f"Benchmarking {capability} for {system_name} and {benchmark_name} batch-size:{benchmark_config['params']['batch-size']} epochs:{benchmark_config['params']['epochs']}")
+    if 'backbone' in params and 'model' not in params:
+        params = {**params, 'model': params['backbone']}
 
-            extra_replacements = {
-                    'NVIDIA_VISIBLE_DEVICES': NVIDIA_VISIBLE_DEVICES,
-                    'NB_CUDA_DEVICES':NB_CUDA_DEVICES,
-                    'SYSTEM_NAME': system_name,
-                    'BENCHMARK_NAME': benchmark_name,
-                    'CAPABILITY': capability
-                    }
+    tags = tags_memory
+    if wandb_config["active"]:
+        additional_tags = ','.join(wandb_config['additional-tags'])
+        tags += ',' + additional_tags
 
+    if interactive_mode:
+        run_mode = f"it -v $PWD/{benchmark_config['docker']['path']}:{benchmark_config['docker']['executable']['path']}"
+    else:
+        run_mode = "d"
 
-            if 'backbone' in benchmark_config['params'] and 'model' not in benchmark_config['params']:
-                benchmark_config['params']['model'] = benchmark_config['params']['backbone']
+    date = datetime.now().strftime("%Y.%m.%d-%H:%M")
 
-            cmd_replacements = {**benchmark_config['params'], **extra_replacements}
-        
-            benchmark_cmd = ""
-            if 'preparation' in benchmark_config:
-                for preparation in benchmark_config['preparation']:
-                    benchmark_cmd += preparation.format(**cmd_replacements) + " && "
+    static_replacements = {
+            **params,
+            'NVIDIA_VISIBLE_DEVICES': NVIDIA_VISIBLE_DEVICES,
+            'NB_CUDA_DEVICES':NB_CUDA_DEVICES,
+            'SYSTEM_NAME': system_name,
+            'BENCHMARK_NAME': benchmark_name
+            }
+
+    preparations = benchmark_config.get('preparation', [])
+
+    run_name_params = f"{static_replacements['model']}-B{static_replacements['batch-size']}xE{static_replacements['epochs']}xLR{static_replacements['learning-rate']}"
+    
+    for capability, is_active in system_config['compute-capabilities'].items():
+        if is_active:
+
+            print(f"Benchmarking {capability} for {system_name} and {benchmark_name} batch-size:{params['batch-size']} epochs:{params['epochs']}")
+
+            cmd_replacements = {**static_replacements, 'CAPABILITY': capability}
 
             if capability not in benchmark_config['docker']['executable']['commands']:
                 print(f"Skipping {capability} for {system_name}-{benchmark_name}")
             else:
-                benchmark_cmd += benchmark_config['docker']['executable']['commands'][capability].format(**cmd_replacements)
+                # formatted per capability so format specs and escaped braces behave as in the templates
+                benchmark_cmd = "".join(preparation.format_map(cmd_replacements) + " && " for preparation in preparations)
+                benchmark_cmd += benchmark_config['docker']['executable']['commands'][capability].format_map(cmd_replacements)
 
-                if interactive_mode:
-                    run_mode = f"it -v $PWD/{benchmark_config['docker']['path']}:{benchmark_config['docker']['executable']['path']}"
-                else:
-                    run_mode = "d"
+                run_name = f"{benchmark_name}-{system_name}-{capability}-{run_name_params}"
 
-                run_name = f"{benchmark_name}-{system_name}-{capability}-{cmd_replacements['model']}-B{cmd_replacements['batch-size']}xE{cmd_replacements['epochs']}xLR{cmd_replacements['learning-rate']}"
-                
-                date = datetime.now().strftime("%Y.%m.%d-%H:%M")
                 wandb = ""
-                WANDB_NOTES=json.dumps(cmd_replacements)
-
-                memory_info = list()
-                for item in ['Size', 'Speed', 'Manufacturer', 'Type', 'Configured Memory Speed', 'Form Factor']:
-                    value = subprocess.check_output(f"dmidecode --type 17 | grep '{item}' | head -n 1", shell=True, text=True).strip().replace(f"{item}: ", "")
-                    key = f"mem_info_{item.lower().replace(' ','_')}"
-                    
-                    for unit in ["MB", "MT/s"]:
-                        if unit in value:
-                            value = value.replace(unit, '').strip()
-                            key += f"_{unit.replace('/','_per_')}"
-
-                    memory_info.append(f"{key}={value}")
-                
-                tags =  ','.join(memory_info)
                 if wandb_config["active"]:
-                    additional_tags = ','.join(wandb_config['additional-tags'])
-                    tags += ',' + additional_tags
+                    # the notes hold CAPABILITY so they are still serialized per capability
+                    WANDB_NOTES=json.dumps(cmd_replacements)
                     wandb = f"-e WANDB_API_KEY={wandb_config['key']} -e WANDB_NAME='{run_name}-{date}' -e WANDB_TAGS='{tags}' -e WANDB_NOTES='{WANDB_NOTES}' -e WANDB_ENTITY={wandb_config['user']} -e WANDB_PROJECT={wandb_config['project']}"
 
                 cmd = f"docker run -{run_mode} --rm --ipc=host --name={run_name} {wandb} {mounts} -e run_name={run_name} --gpus 'device={NVIDIA_VISIBLE_DEVICES}' -w {benchmark_config['docker']['executable']['path']} -e PRECISION={capability} {benchmark_name} bash -c '{benchmark_cmd}'"
@@ -199,70 +383,161 @@ def generate_docker(system_name, system_config, benchmark_name, benchmark_config
                     cmd
                     ])
                 print("============")
-    
-    engine = create_engine(f'sqlite:///{tracking_db}', echo=False)
-    df = pd.DataFrame(experiments, columns=headers)
-    df.to_sql('tasks', con=engine, if_exists='append')
+
+    return experiments
 
 def get_docker_status(docker_name):
     status = None
 
-def runner(tracking_db, interactive_mode, show_cmd):
-    while True:
-        try:
-            run_cycle(interactive_mode, show_cmd, tracking_db)
-        except Exception as e:
-            print("Error while running the run_cycle")
-            print(e)
-        time.sleep(60)
-
-def run_cycle(interactive_mode, show_cmd, tracking_db):
-    db_conn = create_connection(tracking_db)
-    df = pd.read_sql_query("SELECT * FROM tasks", db_conn)
-    client = docker.from_env()
-    running_containers_list = list()
-    gpus_status = GPUStatCollection.new_query().jsonify()
-    gpus_status_dict = dict()
-
-    for gpu in gpus_status['gpus']:
-        gpus_status_dict[gpu['index']] = len(gpu['processes'])
+def get_running_containers():
+    # names only, avoids fetching and building a full container object per running container
+    docker_ps = subprocess.run(["docker", "ps", "--format", "{{.Names}}"], capture_output=True, text=True, check=True)
+    return set(docker_ps.stdout.split())
 
-    for container in client.containers.list():
-        print(f"found {container.name}")
-        update_task_status(db_conn, container.name, 'RUNNING')
-        running_containers_list.append(container.name)
-
-    bar = alive_it(it=df.iterrows(), total=df.shape[0])
-    for index, row in bar:
-        bar.text(f"{row['docker_name']}: {row['status']}")
-        if row['status'] == 'RUNNING' and row['docker_name'] not in running_containers_list:
-            update_task_status(db_conn, container.name, 'FINISHED')
-
-        if row['status'] == 'PENDING':
-            gpus_status = GPUStatCollection.new_query().jsonify()
-            gpus_status_dict = dict()
-            for gpu in gpus_status['gpus']:
-                gpus_status_dict[gpu['index']] = len(gpu['processes'])
-
-            gpus_for_run = str(row['devices']).split(',')
+def get_gpus_processes(nvml_handles):
+    gpus_status_dict = dict()
+    for index, handle in nvml_handles.items():
+        processes = pynvml.nvmlDeviceGetComputeRunningProcesses(handle) + pynvml.nvmlDeviceGetGraphicsRunningProcesses(handle)
+        gpus_status_dict[index] = len({process.pid for process in processes})
+    return gpus_status_dict
+
+def get_tasks(tracking_db, tasks_cache):
+    # reconnect when the db file was replaced (--reset_tracking_db), the open connection keeps
+    # the old inode allocated so a recreated file always gets a new one
+    db_stat = os.stat(tracking_db)
+    db_id = (db_stat.st_dev, db_stat.st_ino)
+    if tasks_cache.get('db_id') != db_id:
+        if 'db_conn' in tasks_cache:
+            tasks_cache['db_conn'].close()
+        tasks_cache.clear()
+        tasks_cache['db_conn'] = create_connection(tracking_db)
+        tasks_cache['db_id'] = db_id
+
+    # data_version only changes on commits from other connections, the runner applies its own writes to the dataframe
+    db_conn = tasks_cache['db_conn']
+    data_version = db_conn.execute("PRAGMA data_version").fetchone()[0]
+    if tasks_cache.get('data_version') != data_version:
+        tasks_cache['df'] = pd.read_sql_query("SELECT * FROM tasks", db_conn)
+        tasks_cache['data_version'] = data_version
+    return db_conn, tasks_cache['df']
+
+def set_tasks_status(db_conn, df, docker_names, status):
+    # the cached dataframe only follows writes that reached the db, a failed one is retried next cycle
+    if not update_tasks_status(db_conn, docker_names, status):
+        return False
+    df.loc[df.docker_name.isin(docker_names), 'status'] = status
+    return True
+
+def runner(tracking_db, interactive_mode, show_cmd, poll_interval_min, poll_interval_max):
+    # nvml is initialized once and the device handles are reused by every cycle
+    pynvml.nvmlInit()
+    nvml_handles = {index: pynvml.nvmlDeviceGetHandleByIndex(index) for index in range(pynvml.nvmlDeviceGetCount())}
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # kill -USR1 wakes the runner up for an immediate cycle, the signal is only seen through the
+    # wakeup fd so the handler never has to take a lock the main thread may hold
+    wake_up_read, wake_up_write = os.pipe()
+    os.set_blocking(wake_up_read, False)
+    os.set_blocking(wake_up_write, False)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: None)
+    previous_wakeup_fd = signal.set_wakeup_fd(wake_up_write, warn_on_full_buffer=False)
+    poll_interval = poll_interval_min
+    tasks_cache = dict()
+    # docker_name -> (docker run process, gpus) for runs launched but not seen running yet
+    launching = dict()
+    try:
+        while True:
+            try:
+                dirty = run_cycle(interactive_mode, show_cmd, tracking_db, tasks_cache, nvml_handles, launching)
+            except Exception as e:
+                print("Error while running the run_cycle")
+                print(e)
+                dirty = False
+
+            # poll quickly while tasks change, back off while the queue is idle
+            if dirty:
+                poll_interval = poll_interval_min
+            else:
+                poll_interval = min(poll_interval * 2, poll_interval_max)
+            if select.select([wake_up_read], [], [], poll_interval)[0]:
+                os.read(wake_up_read, 4096)
+    finally:
+        signal.set_wakeup_fd(previous_wakeup_fd)
+        os.close(wake_up_read)
+        os.close(wake_up_write)
+        if 'db_conn' in tasks_cache:
+            tasks_cache['db_conn'].close()
+        pynvml.nvmlShutdown()
+
+def run_cycle(interactive_mode, show_cmd, tracking_db, tasks_cache, nvml_handles, launching):
+    db_conn, df = get_tasks(tracking_db, tasks_cache)
+    # polled before listing the containers so a docker run finishing in between is not taken for a finished run
+    launch_returncodes = {docker_name: process.poll() for docker_name, (process, gpus) in launching.items()}
+    running_containers_list = get_running_containers()
+    gpus_status_dict = get_gpus_processes(nvml_handles)
+    dirty = False
+
+    for container_name in running_containers_list:
+        print(f"found {container_name}")
+
+    # only write the tasks whose status actually changes
+    started = df.loc[(df.status != 'RUNNING') & (df.docker_name.isin(running_containers_list)), 'docker_name'].tolist()
+    if started and set_tasks_status(db_conn, df, started, 'RUNNING'):
+        dirty = True
+
+    for docker_name, (process, gpus) in list(launching.items()):
+        if docker_name in running_containers_list:
+            # keep the gpus claimed until the run shows up on them, the next cycle may come within seconds
+            if any(gpus_status_dict[int(gpu)] for gpu in gpus):
+                del launching[docker_name]
+        elif launch_returncodes[docker_name] is not None:
+            if launch_returncodes[docker_name] == 0:
+                # the container already ran to completion between two cycles
+                status = 'FINISHED'
+            else:
+                print(f"FAILED TO START: {docker_name}")
+                status = 'FAILED'
+            if set_tasks_status(db_conn, df, [docker_name], status):
+                dirty = True
+                del launching[docker_name]
+
+    launching_gpus = {gpu for process, gpus in launching.values() for gpu in gpus}
+
+    finished = df.loc[(df.status == 'RUNNING') & (~df.docker_name.isin(running_containers_list)), 'docker_name'].tolist()
+    if finished and set_tasks_status(db_conn, df, finished, 'FINISHED'):
+        dirty = True
+
+    pending = df[df.status == 'PENDING']
+    bar = alive_it(it=pending.itertuples(index=False), total=pending.shape[0])
+    for row in bar:
+        bar.text(f"{row.docker_name}: {row.status}")
+        gpus_for_run = str(row.devices).split(',')
+
+        nb_processes_for_run = 0
+        for gpu in gpus_for_run:
+            nb_processes_for_run += gpus_status_dict[int(gpu)]
+       #     print(gpus_status_dict)
+        
+        if nb_processes_for_run == 0 and launching_gpus.isdisjoint(gpus_for_run):
+            # mark the task before launching it so a failed write can never lead to a second launch
+            if not set_tasks_status(db_conn, df, [row.docker_name], 'STARTING'):
+                continue
+            dirty = True
+            print(f"STARTING: {row.docker_name}")
+            cmd = row.cmd
+            if interactive_mode:
+                cmd = cmd.replace(' -d ', ' -it ')
+            if show_cmd:
+                print()
+                print(cmd)
+                print()
+            if interactive_mode:
+                subprocess.run(cmd, shell=True)
+            else:
+                # docker run -d detaches, readiness is checked against the running containers next cycle
+                launching[row.docker_name] = (subprocess.Popen(cmd, shell=True, stdout=subprocess.DEVNULL), gpus_for_run)
+                launching_gpus.update(gpus_for_run)
 
-            nb_processes_for_run = 0
-            for gpu in gpus_for_run:
-                nb_processes_for_run += gpus_status_dict[int(gpu)]
-           #     print(gpus_status_dict)
-            
-            if nb_processes_for_run == 0:
-                print(f"STARTING: {row['docker_name']}")
-                cmd = row['cmd']
-                if interactive_mode:
-                    cmd = cmd.replace(' -d ', ' -it ')
-                if show_cmd:
-                    print()
-                    print(cmd)
-                    print()
-                os.system(cmd)
-                update_task_status(db_conn, row['docker_name'], 'STARTING')
-                time.sleep(60)
+    return dirty
 
 
 @click.command()
@@ -276,8 +551,13 @@ def run_cycle(interactive_mode, show_cmd, tracking_db):
 @click.option('--skip_generate_tracking', is_flag=True, default=False, help="Generate Tracking benchmark")
 @click.option('--clean_wandb', is_flag=True, default=False, help="Clean all wandb run for project")
 @click.option('--show_cmd', is_flag=True, default=False, help="Show the run command when a run is started")
+@click.option('--poll_interval_min', default=2, type=click.FloatRange(min=0.1), help="Runner poll interval in seconds after a task status changed")
+@click.option('--poll_interval_max', default=30, type=click.FloatRange(min=0.1), help="Runner poll interval in seconds when idle")
 def main(benchmark_config_file, interactive_mode, kill_all, tracking_db, reset_tracking_db, run, run_only, 
-            skip_generate_tracking, clean_wandb, show_cmd):
+            skip_generate_tracking, clean_wandb, show_cmd, poll_interval_min, poll_interval_max):
+    if poll_interval_min > poll_interval_max:
+        raise click.BadParameter("must not be greater than --poll_interval_max", param_hint="'--poll_interval_min'")
+
     config = get_config(benchmark_config_file)
 
     global headers
@@ -319,7 +599,11 @@ status text NOT NULL,
 cmd text NOT NULL
 );""")
 
-        generate_all_benchmarks(config, interactive_mode, tracking_db)
+        # a single engine and connection for the whole generation instead of one engine per benchmark
+        engine = create_engine(f'sqlite:///{tracking_db}', echo=False)
+        with engine.connect() as tracking_conn:
+            generate_all_benchmarks(config, interactive_mode, tracking_conn, ','.join(get_memory_info()))
+        engine.dispose()
 
 
 
@@ -328,11 +612,11 @@ cmd text NOT NULL
         print("Cleaning wandb")
         print("============")
         os.environ['WANDB_API_KEY'] = config['wandb']['key']
-        runs = wandb.Api().runs(f"{config['wandb']['user']}/{config['wandb']['project']}")
+        runs = get_wandb_api().runs(f"{config['wandb']['user']}/{config['wandb']['project']}")
 
-        pool = mp.Pool(mp.cpu_count())
-        results = pool.starmap(clean_wandb_id, [(this_run.id, config) for this_run in runs])
-        pool.close()
+        # deletes are network bound, threads avoid forking and pickling for each run
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            results = list(executor.map(lambda this_run: clean_wandb_id(this_run.id, config), runs))
 
         if False in results:
             print("Cleaning wandb failed please check logs")
@@ -341,7 +625,7 @@ cmd text NOT NULL
         print("============")
         print("Running benchmark")
         print("============")
-        runner(tracking_db, interactive_mode, show_cmd)
+        runner(tracking_db, interactive_mode, show_cmd, poll_interval_min, poll_interval_max)
 
     
 